@@ -0,0 +1,149 @@
+"""Same-day on-disk cache for yfinance batch downloads."""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable
+
+import pandas as pd
+import yfinance as yf
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR = Path("data/cache")
+
+
+def _cache_dir(period: str, interval: str) -> Path:
+    return CACHE_DIR / date.today().isoformat() / f"{period}_{interval}"
+
+
+def _ticker_path(folder: Path, ticker: str) -> Path:
+    return folder / f"{ticker.replace('/', '_')}.parquet"
+
+
+def _prune_stale(today: str) -> None:
+    for path in CACHE_DIR.iterdir():
+        if path.name == today:
+            continue
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+
+def _ticker_level(columns: pd.MultiIndex, tickers: list[str]) -> int:
+    wanted = set(tickers)
+    for level in range(columns.nlevels):
+        if wanted.intersection(columns.get_level_values(level)):
+            return level
+    return 0
+
+
+def _downloaded(data: pd.DataFrame, tickers: list[str]) -> pd.DataFrame:
+    """Keep only the tickers that came back with at least one value.
+
+    yfinance reports failed and rate-limited tickers as all-NaN columns rather
+    than raising, so those must not be frozen into the day's cache.
+    """
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        return data if data.notna().to_numpy().any() else data.iloc[:, :0]
+    level = _ticker_level(data.columns, tickers)
+    has_values = data.notna().T.groupby(level=level).any().any(axis=1)
+    return data.loc[:, data.columns.get_level_values(level).isin(has_values.index[has_values])]
+
+
+def _split(data: pd.DataFrame, tickers: list[str]) -> dict[str, pd.DataFrame]:
+    """Break a batch download into one flat OHLCV frame per ticker."""
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        return {tickers[0]: data} if not data.columns.empty else {}
+    level = _ticker_level(data.columns, tickers)
+    return {
+        ticker: data.xs(ticker, axis=1, level=level)
+        for ticker in dict.fromkeys(data.columns.get_level_values(level))
+    }
+
+
+def cached_tickers(tickers: list[str], period: str = "1y", interval: str = "1d") -> set[str]:
+    """Return the tickers whose bars are already on disk for today."""
+
+    folder = _cache_dir(period, interval)
+    return {ticker for ticker in tickers if _ticker_path(folder, ticker).exists()}
+
+
+def cached_download(
+    tickers: list[str],
+    period: str = "1y",
+    interval: str = "1d",
+    on_miss: Callable[[int], None] | None = None,
+    on_fetched: Callable[[int, int], None] | None = None,
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """Return ``yf.download`` output, reusing today's copy from disk if present.
+
+    Daily bars only change once per session, so re-runs on the same day read
+    the parquet files instead of hitting Yahoo again. Each ticker is stored on
+    its own, so a batch hits the cache however the ticker list was sliced.
+    Only tickers that actually downloaded are cached; the rest are requested
+    again on the next call.
+
+    Args:
+        tickers: Symbols to download.
+        period: yfinance history period.
+        interval: yfinance bar interval.
+        on_miss: Called with the number of tickers just before going to Yahoo,
+            e.g. to take rate-limit tokens.
+        on_fetched: Called after going to Yahoo with the number of tickers
+            that came back with bars and the number requested.
+        **kwargs: Passed through to ``yf.download``.
+
+    Returns:
+        The OHLCV frame with columns grouped by ticker, or ``yf.download``'s
+        own output when nothing could be read or downloaded.
+    """
+
+    folder = _cache_dir(period, interval)
+    frames = {}
+    to_fetch = []
+    for ticker in tickers:
+        path = _ticker_path(folder, ticker)
+        if path.exists():
+            frames[ticker] = pd.read_parquet(path)
+        else:
+            to_fetch.append(ticker)
+    if frames:
+        LOGGER.info("Loaded %s of %s tickers from the day cache", len(frames), len(tickers))
+
+    data = None
+    if to_fetch:
+        if on_miss is not None:
+            on_miss(len(to_fetch))
+        data = yf.download(
+            tickers=" ".join(to_fetch),
+            period=period,
+            interval=interval,
+            **kwargs,
+        )
+        fresh = _split(_downloaded(data, to_fetch), to_fetch) if data is not None else {}
+        if on_fetched is not None:
+            on_fetched(len(fresh), len(to_fetch))
+        if fresh:
+            folder.mkdir(parents=True, exist_ok=True)
+            _prune_stale(date.today().isoformat())
+        for ticker, frame in fresh.items():
+            # Publish atomically so an interrupted run never leaves a torn file.
+            path = _ticker_path(folder, ticker)
+            tmp_path = path.with_name(path.name + ".tmp")
+            frame.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+        frames.update(fresh)
+
+    if not frames:
+        return data
+    ordered = {ticker: frames[ticker] for ticker in tickers if ticker in frames}
+    return pd.concat(ordered, axis=1).sort_index()
@@ -0,0 +1,125 @@
+"""Compiled indicator kernels for the scanner hot path."""
+
+from __future__ import annotations
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def _fmax(a, b):
+    # np.fmax for scalars: the larger of the two, ignoring a NaN side.
+    if a != a:
+        return b
+    if b != b:
+        return a
+    return a if a > b else b
+
+
+@njit(cache=True, error_model="numpy")
+def _momentum_last(close, high, low, volume, period, sma_n, vol_n):
+    n = close.shape[0]
+    alpha = 1.0 / period
+
+    # Wilder-smoothed gain/loss and true range, seeded on the first bar.
+    avg_gain = np.nan
+    avg_loss = np.nan
+    # ATR follows pandas' ewm(adjust=False): a bar with no finite true-range
+    # term leaves it unchanged, and the weight it would have had carries over.
+    atr = high[0] - low[0]
+    atr_weight = 1.0
+    for i in range(1, n):
+        delta = close[i] - close[i - 1]
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        if i == 1:
+            avg_gain = gain
+            avg_loss = loss
+        else:
+            avg_gain += alpha * (gain - avg_gain)
+            avg_loss += alpha * (loss - avg_loss)
+        true_range = _fmax(
+            _fmax(high[i] - low[i], abs(high[i] - close[i - 1])), abs(low[i] - close[i - 1])
+        )
+        if atr != atr:
+            atr = true_range
+        elif true_range == true_range:
+            atr_weight *= 1.0 - alpha
+            atr = (atr_weight * atr + alpha * true_range) / (atr_weight + alpha)
+            atr_weight = 1.0
+        else:
+            atr_weight *= 1.0 - alpha
+
+    sma = np.nan
+    if n >= sma_n:
+        total = 0.0
+        for i in range(n - sma_n, n):
+            total += close[i]
+        sma = total / sma_n
+
+    vol_ratio = np.nan
+    if n >= vol_n:
+        total = 0.0
+        for i in range(n - vol_n, n):
+            total += volume[i]
+        vol_ratio = volume[n - 1] / (total / vol_n)
+
+    rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return sma, rsi, vol_ratio, atr
+
+
+def trend_last(close: np.ndarray, period: int = 14, sma_n: int = 200) -> tuple[float, float]:
+    """Return the final-bar SMA and RSI from closing prices alone.
+
+    Args:
+        close: Closing prices, oldest first.
+        period: Wilder smoothing period for RSI.
+        sma_n: Window of the simple moving average.
+
+    Returns:
+        ``(sma, rsi)``; NaN where the history is too short.
+    """
+
+    # High/low/volume only feed ATR and the volume ratio, which are discarded.
+    sma, rsi, _, _ = _momentum_last(close, close, close, np.ones_like(close), period, sma_n, 1)
+    return sma, rsi
+
+
+@njit(parallel=True, cache=True, error_model="numpy")
+def _momentum_rows(bars, lengths, rows, close_f, high_f, low_f, volume_f, period, sma_n, vol_n):
+    n_bars = bars.shape[1]
+    out = np.empty((rows.shape[0], 4))
+    for k in prange(rows.shape[0]):
+        series = bars[rows[k], n_bars - lengths[rows[k]]:]
+        out[k, 0], out[k, 1], out[k, 2], out[k, 3] = _momentum_last(
+            series[:, close_f], series[:, high_f], series[:, low_f], series[:, volume_f],
+            period, sma_n, vol_n,
+        )
+    return out
+
+
+def momentum_rows(
+    bars: np.ndarray,
+    lengths: np.ndarray,
+    rows: np.ndarray,
+    fields: tuple[int, int, int, int],
+    period: int = 14,
+    sma_n: int = 200,
+    vol_n: int = 20,
+) -> np.ndarray:
+    """Return final-bar SMA, RSI, volume ratio and ATR for many tickers, spread across cores.
+
+    Args:
+        bars: ``(tickers x bars x fields)`` array, each row's history right-aligned.
+        lengths: Number of valid trailing bars per ticker.
+        rows: Indices into ``bars`` of the tickers to evaluate.
+        fields: Positions of close, high, low and volume in the last axis.
+        period: Wilder smoothing period for RSI and ATR.
+        sma_n: Window of the simple moving average.
+        vol_n: Window of the average volume used for the ratio.
+
+    Returns:
+        A ``(len(rows) x 4)`` array of SMA, RSI, volume ratio and ATR per row.
+    """
+
+    return _momentum_rows(bars, lengths, np.asarray(rows, dtype=np.int64), *fields, period, sma_n, vol_n)
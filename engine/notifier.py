@@ -1,29 +1,237 @@
 import requests
 import os
 import logging
+import queue
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from engine.rate_limit import TokenBucket
+
+LOGGER = logging.getLogger(__name__)
 
 class Notifier:
+    API_URL = "https://api.telegram.org"
+    MAX_ATTEMPTS = 8
+    MAX_BACKOFF_SECONDS = 60
+    # Telegram allows ~30 msg/s per bot and ~1 msg/s per chat.
+    GLOBAL_RATE = 25
+    GLOBAL_RATE_CAP = 30
+    CHAT_RATE = 1
+    # Concurrent sends overlap round trips with the buckets' waits; matches pool_maxsize.
+    MAX_WORKERS = 4
+    # Telegram's sendMessage limit, counted in UTF-16 code units.
+    MAX_MESSAGE_LENGTH = 4096
+    SEPARATOR = "\n\n━━━━━\n\n"
+    _TEMPLATE = (
+        "🚀 *SWING SIGNAL: {ticker}*\n"
+        "💰 Entry: `{entry}`\n"
+        "🎯 Target (+25%): `{target}`\n"
+        "🛑 Stop (2x ATR): `{stop}`\n"
+        "📊 RSI: {rsi}\n\n"
+        "📰 *Catalysts:*\n{news}\n\n"
+        "🔗 [Yahoo Finance](https://finance.yahoo.com/quote/{ticker})"
+    )
+
     def __init__(self):
         self.token = os.getenv("TELEGRAM_BOT_TOKEN")
         self.chat_id = os.getenv("TELEGRAM_CHAT_ID")
         self.enabled = True
         if not self.token or not self.chat_id:
             self.enabled = False
-            logging.getLogger(__name__).warning(
+            LOGGER.warning(
                 "Telegram notifier disabled: TELEGRAM_BOT_TOKEN or TELEGRAM_CHAT_ID is not set."
             )
+        # Keep the connection to api.telegram.org alive between alerts.
+        self._session = requests.Session()
+        self._session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.MAX_WORKERS)
+        )
+        self._global_bucket = TokenBucket(self.GLOBAL_RATE_CAP, self.GLOBAL_RATE)
+        self._chat_buckets = {}
+        self._queue = None
+        self._worker = None
+        self._delivered = []
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets.setdefault(chat_id, TokenBucket(1, self.CHAT_RATE))
+        return bucket
+
+    def _backoff_seconds(self, response, attempt):
+        """Seconds to wait before retrying, preferring Telegram's own hint."""
+        retry_after = None
+        if response is not None:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+            if retry_after is None:
+                retry_after = response.headers.get("Retry-After")
+        try:
+            # A flood-wait hint can run to hours; cap it so one reply cannot
+            # stall the sender. Still throttled, the send fails and retries next run.
+            delay = min(float(retry_after), self.MAX_BACKOFF_SECONDS)
+        except (TypeError, ValueError):
+            delay = min(2 ** attempt, self.MAX_BACKOFF_SECONDS)
+        return delay + random.uniform(0, 0.5)
+
+    def _post_with_retry(self, path, payload):
+        url = f"{self.API_URL}/bot{self.token}/{path}"
+        buckets = (self._global_bucket, self._chat_bucket(payload.get("chat_id")))
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            response = None
+            for bucket in buckets:
+                bucket.acquire()
+            try:
+                response = self._session.post(url, json=payload, timeout=30)
+                if response.status_code == 429:
+                    for bucket in buckets:
+                        bucket.decrease_rate(0.5)
+                elif response.status_code < 500:
+                    response.raise_for_status()
+                    self._global_bucket.increase_rate(1, self.GLOBAL_RATE_CAP)
+                    buckets[1].increase_rate(0.1, self.CHAT_RATE)
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.MAX_ATTEMPTS:
+                    raise
+            if attempt == self.MAX_ATTEMPTS:
+                response.raise_for_status()
+            backoff_seconds = self._backoff_seconds(response, attempt - 1)
+            LOGGER.warning(
+                "Telegram %s failed (status=%s attempt=%s backoff_seconds=%.1f)",
+                path,
+                response.status_code if response is not None else None,
+                attempt,
+                backoff_seconds,
+            )
+            time.sleep(backoff_seconds)
+
+    @classmethod
+    def format_signal_message(cls, data):
+        return cls._TEMPLATE.format_map(data)
+
+    @staticmethod
+    def _message_length(text):
+        return len(text.encode("utf-16-le")) // 2
+
+    def _pack_messages(self, signals):
+        """Greedily pack formatted signals into as few messages as the limit allows."""
+        packed = []
+        text, members = "", []
+        separator_length = self._message_length(self.SEPARATOR)
+        length = 0
+        for data in signals:
+            msg = self.format_signal_message(data)
+            msg_length = self._message_length(msg)
+            if members and length + separator_length + msg_length > self.MAX_MESSAGE_LENGTH:
+                packed.append((text, members))
+                text, members, length = "", [], 0
+            if members:
+                text += self.SEPARATOR
+                length += separator_length
+            text += msg
+            length += msg_length
+            members.append(data)
+        if members:
+            packed.append((text, members))
+        return packed
+
+    def _send_text(self, text):
+        self._post_with_retry(
+            "sendMessage",
+            {"chat_id": self.chat_id, "text": text, "parse_mode": "Markdown"},
+        )
+
+    def _deliver(self, packed):
+        text, members = packed
+        try:
+            self._send_text(text)
+            return members
+        except requests.RequestException as exc:
+            response = getattr(exc, "response", None)
+            if len(members) < 2 or response is None or response.status_code != 400:
+                LOGGER.exception(
+                    "Telegram alert failed for %s", ", ".join(d["ticker"] for d in members)
+                )
+                return []
+        # One headline with unbalanced Markdown rejects the whole pack; resend
+        # its alerts one by one so only the offending one is lost.
+        LOGGER.warning(
+            "Telegram rejected a packed message; resending its %s alerts one by one", len(members)
+        )
+        return [
+            data
+            for member in members
+            for data in self._deliver((self.format_signal_message(member), [member]))
+        ]
+
+    def send_alerts(self, signals):
+        """Send signals in as few messages as possible; returns those delivered."""
+        if not self.enabled:
+            return []
+        packed = self._pack_messages(signals)
+        if len(packed) <= 1:
+            return [data for batch in map(self._deliver, packed) for data in batch]
+        # The token buckets still pace every POST; the pool only overlaps waits.
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(packed))) as pool:
+            return [data for batch in pool.map(self._deliver, packed) for data in batch]
 
     def send_alert(self, data):
+        return bool(self.send_alerts([data]))
+
+    def start(self):
+        """Start a background sender; feed it with ``submit`` and end with ``finish``."""
+        self._queue = queue.SimpleQueue()
+        self._delivered = []
+        self._worker = threading.Thread(target=self._drain, name="telegram-alerts", daemon=True)
+        self._worker.start()
+
+    def submit(self, signals):
+        """Queue signals for the background sender without waiting on Telegram."""
         if not self.enabled:
+            # Nothing to send, but the signals still earn their cooldown.
+            self._delivered.extend(signals)
             return
-        msg = (
-            f"🚀 *SWING SIGNAL: {data['ticker']}*\n"
-            f"💰 Entry: `{data['entry']}`\n"
-            f"🎯 Target (+25%): `{data['target']}`\n"
-            f"🛑 Stop (2x ATR): `{data['stop']}`\n"
-            f"📊 RSI: {data['rsi']}\n\n"
-            f"📰 *Catalysts:*\n{data['news']}\n\n"
-            f"🔗 [Yahoo Finance](https://finance.yahoo.com/quote/{data['ticker']})"
-        )
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
-        requests.post(url, json={"chat_id": self.chat_id, "text": msg, "parse_mode": "Markdown"})
+        self._queue.put(list(signals))
+
+    def finish(self):
+        """Wait for every queued signal to be sent; returns those delivered.
+
+        With Telegram disabled every submitted signal counts as delivered.
+        """
+        self._queue.put(None)
+        self._worker.join()
+        self._worker = None
+        return self._delivered
+
+    def _drain(self):
+        while True:
+            pending = self._queue.get()
+            done = pending is None
+            pending = pending or []
+            # Whatever queued up during the last send goes out packed together.
+            while not done and not self._queue.empty():
+                more = self._queue.get()
+                if more is None:
+                    done = True
+                else:
+                    pending.extend(more)
+            if pending:
+                try:
+                    self._delivered.extend(self.send_alerts(pending))
+                except Exception:
+                    LOGGER.exception("Background Telegram send failed")
+            if done:
+                return
+
+    def close(self):
+        """Flush a running background sender; returns what it delivered, if anything."""
+        delivered = self.finish() if self._worker is not None else []
+        self._session.close()
+        return delivered
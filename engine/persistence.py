@@ -1,45 +1,124 @@
+import json
 import sqlite3
+import threading
 from datetime import datetime, timedelta
 
 class DatabaseManager:
+    # Cached Yahoo metadata older than this is dropped on start-up.
+    METADATA_CACHE_DAYS = 7
+
     def __init__(self, db_path="data/trading_universe.db"):
         self.db_path = db_path
+        self._lock = threading.Lock()
+        # In-process exclusion sets keyed by cooldown days; see excluded_tickers.
+        self._excluded = {}
         self._init_db()
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
+        # One long-lived connection; the lock serialises use across threads.
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        with self._conn:
+            self._conn.execute("""
                 CREATE TABLE IF NOT EXISTS signals (
                     ticker TEXT, date TEXT, price REAL, PRIMARY KEY(ticker, date)
                 )""")
-            conn.execute("""
+            self._conn.execute("""
                 CREATE TABLE IF NOT EXISTS blacklist (
-                    ticker TEXT, expiry_date TEXT PRIMARY KEY
+                    ticker TEXT PRIMARY KEY, expiry_date TEXT
+                )""")
+            # Lets the cooldown check range-scan recent signals instead of
+            # seeking the primary key once per candidate.
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_signals_date_ticker ON signals(date, ticker)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS metadata_cache (
+                    ticker TEXT PRIMARY KEY, json TEXT, fetched_at TEXT
                 )""")
+            self._conn.execute(
+                "DELETE FROM metadata_cache WHERE fetched_at < ?",
+                ((datetime.now() - timedelta(days=self.METADATA_CACHE_DAYS)).isoformat(),))
+        self._migrate_blacklist_key()
+        self.prune_expired_blacklist()
 
-    def is_blacklisted(self, ticker):
-        with sqlite3.connect(self.db_path) as conn:
-            res = conn.execute("SELECT 1 FROM blacklist WHERE ticker = ? AND expiry_date > ?",
-                               (ticker, datetime.now().isoformat())).fetchone()
-            return res is not None
+    def _migrate_blacklist_key(self):
+        """Rekey blacklists created with the old PRIMARY KEY(expiry_date) on ticker."""
+        columns = {row[1]: row[5] for row in self._conn.execute("PRAGMA table_info(blacklist)")}
+        if columns.get("ticker"):
+            return
+        self._conn.executescript("""
+            BEGIN;
+            ALTER TABLE blacklist RENAME TO blacklist_old;
+            CREATE TABLE blacklist (ticker TEXT PRIMARY KEY, expiry_date TEXT);
+            INSERT INTO blacklist
+                SELECT ticker, MAX(expiry_date) FROM blacklist_old
+                WHERE ticker IS NOT NULL GROUP BY ticker;
+            DROP TABLE blacklist_old;
+            COMMIT;
+        """)
 
-    def record_signal(self, ticker, price):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("INSERT OR REPLACE INTO signals VALUES (?, ?, ?)",
-                         (ticker, datetime.now().isoformat(), price))
+    def prune_expired_blacklist(self):
+        """Deletes blacklist rows whose expiry has passed; no lookup can match them."""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM blacklist WHERE expiry_date <= ?",
+                                      (datetime.now().isoformat(),)).rowcount
 
-    def was_alerted_recently(self, ticker, days=21):
-        """
-        Checks if we've already signaled this ticker in the last 3 weeks.
-        3 weeks (21 days) matches your 3-4 week swing trade window.
-        Signal timestamps use ISO format to match how they are stored.
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record_signals(self, signals):
+        """Records (ticker, price) pairs in a single transaction."""
+        signals = list(signals)
+        if not signals:
+            # Even an empty executemany would BEGIN and COMMIT a write transaction.
+            return
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO signals VALUES (?, ?, ?)",
+                                   ((ticker, now, price) for ticker, price in signals))
+            recorded = {ticker for ticker, _ in signals}
+            self._excluded = {days: excluded | recorded for days, excluded in self._excluded.items()}
+
+    def get_metadata(self, ticker, ttl_hours=24):
+        """Returns the cached Yahoo metadata dict for ``ticker``, or None if missing or stale."""
+        since = (datetime.now() - timedelta(hours=ttl_hours)).isoformat()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT json FROM metadata_cache WHERE ticker = ? AND fetched_at > ?",
+                (ticker, since)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_metadata(self, ticker, metadata):
+        """Caches a JSON-serialisable metadata dict for ``ticker``, stamped now."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO metadata_cache VALUES (?, ?, ?)",
+                               (ticker, json.dumps(metadata), datetime.now().isoformat()))
+
+    def excluded_tickers(self, days=21):
+        """Returns tickers that are blacklisted or were signaled in the last ``days`` days.
+
+        The 21-day default matches the 3-4 week swing trade window, so a ticker
+        is not alerted again until a typical trade on it has played out.
+
+        Loaded once per ``days`` window and kept in process; ``record_signals``
+        adds to it, so later membership tests never go back to SQLite.
         """
-        # If we alerted on this ticker recently, we don't want to see it again
-        # until the typical swing trade duration has passed.
-        since = (datetime.now() - timedelta(days=days)).isoformat()
-        with sqlite3.connect(self.db_path) as conn:
-            res = conn.execute(
-                "SELECT 1 FROM signals WHERE ticker = ? AND date > ?",
-                (ticker, since)
-            ).fetchone()
-            return res is not None
+        with self._lock:
+            excluded = self._excluded.get(days)
+            if excluded is None:
+                now = datetime.now()
+                since = (now - timedelta(days=days)).isoformat()
+                rows = self._conn.execute(
+                    "SELECT ticker FROM blacklist WHERE expiry_date > ? "
+                    "UNION SELECT ticker FROM signals WHERE date > ?",
+                    (now.isoformat(), since))
+                excluded = self._excluded[days] = frozenset(row[0] for row in rows)
+            return excluded
+
+    def filter_eligible(self, tickers, days=21):
+        """Returns the tickers neither blacklisted nor signaled within ``days`` days, sorted."""
+        excluded = self.excluded_tickers(days)
+        return sorted(ticker for ticker in tickers if ticker not in excluded)
@@ -0,0 +1,78 @@
+"""Thread-safe adaptive token bucket for pacing outbound API calls."""
+
+from __future__ import annotations
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket whose refill rate can be adjusted at runtime.
+
+    A token is taken before every request. On success callers nudge the rate
+    back up towards a cap; on a rate-limit response they cut it
+    multiplicatively, mirroring TCP-style additive-increase/multiplicative-decrease.
+    Like TCP's once-per-RTT rule, a burst of rate-limit responses from
+    concurrent callers cuts the rate once per ``cut_cooldown`` seconds.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        rate: float,
+        min_rate: float = 0.1,
+        cut_cooldown: float = 1.0,
+    ) -> None:
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.cut_cooldown = float(cut_cooldown)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._last_cut = float("-inf")
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until ``tokens`` are available, then consume them.
+
+        Tokens are reserved up front, letting the balance go negative, so each
+        caller sleeps exactly once until its own slot instead of waking with
+        every other waiter to poll the bucket again.
+        """
+
+        if tokens > self.capacity:
+            raise ValueError(f"cannot acquire {tokens} tokens from a bucket of {self.capacity}")
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+    def increase_rate(self, delta: float, cap: float) -> None:
+        """Additively raise the refill rate, never beyond ``cap``."""
+
+        with self._lock:
+            self._refill()
+            self.rate = min(self.rate + delta, cap)
+
+    def decrease_rate(self, beta: float = 0.5) -> bool:
+        """Multiplicatively cut the refill rate, never below ``min_rate``.
+
+        Returns False, leaving the rate alone, if it was already cut within
+        the last ``cut_cooldown`` seconds.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_cut < self.cut_cooldown:
+                return False
+            self._last_cut = now
+            self._refill()
+            self.rate = max(self.rate * beta, self.min_rate)
+            return True
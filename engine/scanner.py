@@ -1,121 +1,338 @@
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
+import requests
 import yfinance as yf
+from yfinance.exceptions import YFRateLimitError
+
+try:
+    from curl_cffi import requests as curl_requests
+except ImportError:  # pragma: no cover - yfinance then falls back to its own session
+    curl_requests = None
+
+from engine.cache import cached_download, cached_tickers
+from engine.indicators import momentum_rows, trend_last
+from engine.rate_limit import TokenBucket
 
 LOGGER = logging.getLogger(__name__)
 
+# T212 market segment -> Yahoo symbol suffix.
+_MARKET_SUFFIX = {"LSE": ".L", "XETRA": ".DE"}
+
+# Field positions in the (tickers x bars x fields) array, matching FIELDS.
+_OPEN, _HIGH, _LOW, _CLOSE, _VOLUME = range(5)
+
 class AlphaScanner:
-    def __init__(self, target_upside=0.25):
+    FIELDS = ("Open", "High", "Low", "Close", "Volume")
+    # Yahoo's spark endpoint returns closes for up to 20 symbols per request.
+    SPARK_URL = "https://query1.finance.yahoo.com/v8/finance/spark"
+    SPARK_SYMBOLS = 20
+    # Spark closes are not dividend-adjusted, which inflates the unadjusted
+    # SMA by at most the trailing year's yield; a 15% margin keeps any ticker
+    # the adjusted full scan would pass. RSI is not screened: one ex-dividend
+    # drop can move it well past any margin.
+    PRESCREEN_SMA_MARGIN = 0.15
+    # Yahoo requests per second, shared by chart downloads, spark and news.
+    # A batch download costs one token per ticker; cache hits cost nothing.
+    # These are throughput caps sized to the old pipeline's pace (a 100-ticker
+    # batch plus a 1 s pause), not Yahoo's limit: the ~60 prices/min often
+    # quoted would slow a full scan tenfold. 429s from any Yahoo call, and
+    # mostly empty downloads, cut the rate until Yahoo stops pushing back.
+    YAHOO_THROUGHPUT = 50
+    YAHOO_THROUGHPUT_CAP = 100
+    YAHOO_BURST = 200
+    # A 100-ticker batch never waits more than 20 s for its tokens, and a burst
+    # of 429s from concurrent workers halves the rate once, not once per reply.
+    YAHOO_RATE_FLOOR = 5
+    YAHOO_CUT_COOLDOWN = 5.0
+    # Share of a download's tickers that must come back with bars: below the
+    # first the batch counts as rate-limited, from the second as healthy.
+    # Smaller fetches are mostly retries of delisted names and prove nothing.
+    DOWNLOAD_LIMITED_FILL = 0.5
+    DOWNLOAD_OK_FILL = 0.9
+    DOWNLOAD_MIN_SAMPLE = 10
+    # Sent on spark calls only when curl_cffi is missing and nothing impersonates.
+    FALLBACK_USER_AGENT = (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+    )
+    # Daily history pulled by the full scan, and the day cache's key with it.
+    HISTORY_PERIOD = "1y"
+    HISTORY_INTERVAL = "1d"
+    # News titles are reused from the metadata store for this long.
+    NEWS_TTL_HOURS = 6
+
+    def __init__(self, target_upside=0.25, max_workers=16, metadata=None):
         self.target_upside = target_upside
+        self.max_workers = max_workers
+        # Optional store with get_metadata/put_metadata, e.g. DatabaseManager.
+        self._metadata = metadata
+        # One keep-alive session to Yahoo shared by downloads, spark and every
+        # worker thread. It must impersonate a browser like yfinance's own, or
+        # Yahoo rate-limits and blocks it; transport failures retry in place.
+        if curl_requests is not None:
+            self._session = curl_requests.Session(
+                impersonate="chrome",
+                retry=curl_requests.RetryStrategy(count=3, delay=0.5, backoff="exponential"),
+            )
+            self._yf_session = self._session
+        else:
+            # Without curl_cffi yfinance manages its own session; spark still
+            # needs a browser User-Agent.
+            self._session = requests.Session()
+            self._session.headers["User-Agent"] = self.FALLBACK_USER_AGENT
+            self._yf_session = None
+        self._ticker_cache = {}
+        self._yahoo_bucket = TokenBucket(
+            self.YAHOO_BURST,
+            self.YAHOO_THROUGHPUT,
+            min_rate=self.YAHOO_RATE_FLOOR,
+            cut_cooldown=self.YAHOO_CUT_COOLDOWN,
+        )
+
+    def _throttle(self, requests_made=1):
+        self._yahoo_bucket.acquire(min(requests_made, self._yahoo_bucket.capacity))
+
+    def _rate_limited(self):
+        if self._yahoo_bucket.decrease_rate(0.5):
+            LOGGER.warning("Yahoo rate limit hit; slowing to %.1f req/s", self._yahoo_bucket.rate)
+
+    def _rate_ok(self):
+        self._yahoo_bucket.increase_rate(1, self.YAHOO_THROUGHPUT_CAP)
 
     def clean_ticker(self, t212_ticker: str) -> str:
         """Maps T212 ticker format to YFinance format."""
         # Example: AAPL_US_EQ -> AAPL | VOD_LSE_EQ -> VOD.L
         if t212_ticker.endswith((".L", ".DE")):
             return t212_ticker
-        parts = t212_ticker.split("_")
-        symbol = parts[0]
-        if len(parts) > 1:
-            market = parts[1]
-            if market == "LSE":
-                return f"{symbol}.L"
-            if market == "XETRA":
-                return f"{symbol}.DE"
-        if "LSE" in t212_ticker:
-            return f"{symbol}.L"
-        if "XETRA" in t212_ticker:
-            return f"{symbol}.DE"
-        return symbol
-
-    def calculate_atr(self, df, window=14):
-        high_low = df['High'] - df['Low']
-        high_close = np.abs(df['High'] - df['Close'].shift())
-        low_close = np.abs(df['Low'] - df['Close'].shift())
-        ranges = pd.concat([high_low, high_close, low_close], axis=1)
-        true_range = np.max(ranges, axis=1)
-        return true_range.rolling(window=window).mean()
-
-    def _scan_dataframe(self, ticker, df):
+        symbol, _, rest = t212_ticker.partition("_")
+        suffix = _MARKET_SUFFIX.get(rest.partition("_")[0])
+        if suffix is None:
+            if "LSE" in t212_ticker:
+                suffix = ".L"
+            elif "XETRA" in t212_ticker:
+                suffix = ".DE"
+            else:
+                suffix = ""
+        return symbol + suffix
+
+    def clean_tickers(self, t212_tickers):
+        """Maps many T212 tickers at once; returns the distinct YFinance symbols."""
+        clean = self.clean_ticker
+        return {clean(ticker) for ticker in t212_tickers}
+
+    def _aligned_bars(self, data, tickers):
+        """Pack a batch download into one (tickers x bars x fields) float32 array.
+
+        Each ticker's own bars are pushed to the end of its row so that bar
+        ``-1`` is every ticker's latest bar and indicator windows never straddle
+        another exchange's holidays, matching a per-ticker ``dropna``. The
+        latest closes also come back in float64, since they become the prices
+        users see.
+        """
+        if not isinstance(data.columns, pd.MultiIndex):
+            data = pd.concat({tickers[0]: data}, axis=1)
+        present = [t for t in tickers if t in data.columns.get_level_values(0)]
+        if not present:
+            return [], None, None, None
+        fields = [data.xs(field, axis=1, level=1).reindex(columns=present).to_numpy(dtype=float).T
+                  for field in self.FIELDS]
+        stacked = np.stack(fields, axis=-1).astype(np.float32)
+        valid = ~np.isnan(stacked).all(axis=2)
+        order = np.argsort(valid, axis=1, kind="stable")
+        bars = np.ascontiguousarray(np.take_along_axis(stacked, order[:, :, None], axis=1))
+        last_close = np.take_along_axis(fields[_CLOSE], order[:, -1:], axis=1)[:, 0]
+        return present, bars, valid.sum(axis=1), last_close
+
+    def _scan_bars(self, tickers, bars, lengths, last_close):
+        """Evaluate the Momentum Igniter rules for every ticker in the batch."""
+        # 1. Liquidity Filter (> £500k avg volume), one reduction for the batch.
+        eligible = np.flatnonzero(lengths >= 200)
+        recent = bars[eligible, -20:]
+        avg_vol_value = np.nanmean(recent[..., _CLOSE] * recent[..., _VOLUME], axis=1)
+        survivors = eligible[avg_vol_value >= 500000]
+
+        # 2. Strategy: Momentum Igniter
+        # Price > 200 SMA, RSI crossing 50, Vol > 2x Avg
+        # One compiled call for the batch; the kernel spreads tickers across cores.
+        sma, rsi, vol_ratio, atr = momentum_rows(
+            bars, lengths, survivors, (_CLOSE, _HIGH, _LOW, _VOLUME)
+        ).T
+        current_price = last_close[survivors]
+        hit = (current_price > sma) & (rsi > 50) & (vol_ratio > 2)
+        return [(tickers[row], float(price), float(r), float(a))
+                for row, price, r, a in zip(survivors[hit], current_price[hit], rsi[hit], atr[hit])]
+
+    def _spark_closes(self, symbols):
+        """Daily closes for the past year keyed by symbol, in one request."""
+        self._throttle()
+        response = self._session.get(
+            self.SPARK_URL,
+            params={"symbols": ",".join(symbols), "range": "1y", "interval": "1d"},
+            timeout=10,
+        )
+        if response.status_code == 429:
+            self._rate_limited()
+        response.raise_for_status()
+        self._rate_ok()
+        payload = response.json()
+        # v8 keys charts by symbol; the older v7 shape nests them under spark.result.
+        if "spark" in payload:
+            payload = {item["symbol"]: item["response"][0]["indicators"]["quote"][0]
+                       for item in payload["spark"].get("result") or []}
+        closes = {}
+        for symbol, chart in payload.items():
+            values = np.array(chart.get("close") or [], dtype=float)
+            closes[symbol] = values[~np.isnan(values)]
+        return closes
+
+    def _prescreen_chunk(self, symbols):
         try:
-            if len(df) < 200:
-                return None
-
-            # 1. Liquidity Filter (> £500k avg volume)
-            avg_vol_value = (df['Close'] * df['Volume']).tail(20).mean()
-            if avg_vol_value < 500000:
-                return None
-
-            # 2. Strategy: Momentum Igniter
-            # Price > 200 SMA, RSI crossing 50, Vol > 2x Avg
-            sma200 = df['Close'].rolling(200).mean().iloc[-1]
-            current_price = df['Close'].iloc[-1]
-            if current_price < sma200:
-                return None
-
-            # RSI Logic
-            delta = df['Close'].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs)).iloc[-1]
-
-            vol_avg = df['Volume'].rolling(20).mean().iloc[-1]
-            current_vol = df['Volume'].iloc[-1]
-
-            if current_price > sma200 and rsi > 50 and current_vol > (vol_avg * 2):
-                atr = self.calculate_atr(df).iloc[-1]
-                
-                # Risk Setup
-                stop_loss = current_price - (2 * atr)
-                target = current_price * (1 + self.target_upside)
-                
-                # News & Catalyst
-                info = yf.Ticker(ticker)
-                news = info.news[:2]
-                news_text = "\n".join([f"• {n['title']}" for n in news])
-
-                return {
-                    "ticker": ticker,
-                    "entry": round(current_price, 2),
-                    "stop": round(stop_loss, 2),
-                    "target": round(target, 2),
-                    "rsi": round(rsi, 1),
-                    "news": news_text
-                }
+            closes = self._spark_closes(symbols)
         except Exception:
-            LOGGER.exception("Scan failed for %s", ticker)
-            return None
-        return None
-
-    def _extract_ticker_frame(self, data, ticker):
-        if isinstance(data.columns, pd.MultiIndex):
-            if ticker not in data.columns.get_level_values(0):
-                return None
-            frame = data[ticker].dropna(how="all")
-            return frame
-        return data.dropna(how="all")
-
-    def scan_universe(self, tickers, batch_size=100, pause_seconds=1):
-        signals = []
-        for start in range(0, len(tickers), batch_size):
-            batch = tickers[start:start + batch_size]
-            LOGGER.info("Downloading batch %s-%s (%s tickers)", start + 1, start + len(batch), len(batch))
-            data = yf.download(
-                tickers=" ".join(batch),
-                period="1y",
-                interval="1d",
-                group_by="ticker",
-                progress=False,
+            LOGGER.warning(
+                "Spark prescreen failed for %s-%s; keeping all", symbols[0], symbols[-1], exc_info=True
             )
-            for ticker in batch:
-                frame = self._extract_ticker_frame(data, ticker)
-                if frame is None or frame.empty:
+            return symbols
+        kept = []
+        for symbol in symbols:
+            series = closes.get(symbol)
+            # Missing or short histories are left for the full scan to judge.
+            if series is None or len(series) < 200:
+                kept.append(symbol)
+                continue
+            sma, _ = trend_last(series)
+            if series[-1] > sma * (1 - self.PRESCREEN_SMA_MARGIN):
+                kept.append(symbol)
+        return kept
+
+    def prescreen(self, tickers):
+        """Drop tickers whose closes alone rule out the 200-day trend condition."""
+        chunks = [tickers[i:i + self.SPARK_SYMBOLS]
+                  for i in range(0, len(tickers), self.SPARK_SYMBOLS)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            kept = [symbol for chunk in pool.map(self._prescreen_chunk, chunks) for symbol in chunk]
+        LOGGER.info("Prescreen kept %s of %s tickers", len(kept), len(tickers))
+        return kept
+
+    def _yf_ticker(self, ticker):
+        yf_ticker = self._ticker_cache.get(ticker)
+        if yf_ticker is None:
+            yf_ticker = self._ticker_cache.setdefault(
+                ticker, yf.Ticker(ticker, session=self._yf_session)
+            )
+        return yf_ticker
+
+    def _fetch_news(self, ticker, limit=2):
+        return self._yf_ticker(ticker).news[:limit]
+
+    def _news_titles(self, ticker):
+        cached = self._metadata.get_metadata(ticker, self.NEWS_TTL_HOURS) if self._metadata else None
+        if cached is not None and "news" in cached:
+            return cached["news"]
+        self._throttle()
+        # yfinance 1.x nests each item's fields under "content"; older releases don't.
+        items = ((n.get("content") or n) for n in self._fetch_news(ticker))
+        titles = [item["title"] for item in items if item.get("title")]
+        self._rate_ok()
+        if self._metadata is not None:
+            self._metadata.put_metadata(ticker, {"news": titles})
+        return titles
+
+    def _news_text(self, ticker):
+        try:
+            titles = self._news_titles(ticker)
+            return "• " + "\n• ".join(titles) if titles else ""
+        except YFRateLimitError:
+            self._rate_limited()
+            return ""
+        except Exception:
+            LOGGER.exception("News lookup failed for %s", ticker)
+            return ""
+
+    def _build_signal(self, ticker, current_price, rsi, atr):
+        # Risk Setup
+        stop_loss = current_price - (2 * atr)
+        target = current_price * (1 + self.target_upside)
+
+        return {
+            "ticker": ticker,
+            "entry": round(current_price, 2),
+            "stop": round(stop_loss, 2),
+            "target": round(target, 2),
+            "rsi": round(rsi, 1),
+        }
+
+    def _download_batch(self, start, batch):
+        LOGGER.info("Downloading batch %s-%s (%s tickers)", start + 1, start + len(batch), len(batch))
+
+        def on_miss(count):
+            # yf.download issues one chart request per ticker.
+            self._throttle(count)
+
+        def on_fetched(filled, requested):
+            # yf.download turns 429s into all-NaN columns instead of raising,
+            # so a mostly empty batch is the downloads' rate-limit signal.
+            if requested < self.DOWNLOAD_MIN_SAMPLE:
+                return
+            if filled < requested * self.DOWNLOAD_LIMITED_FILL:
+                self._rate_limited()
+            elif filled >= requested * self.DOWNLOAD_OK_FILL:
+                self._rate_ok()
+
+        data = cached_download(
+            batch,
+            period=self.HISTORY_PERIOD,
+            interval=self.HISTORY_INTERVAL,
+            on_miss=on_miss,
+            on_fetched=on_fetched,
+            group_by="ticker",
+            progress=False,
+            threads=self.max_workers,
+            session=self._yf_session,
+        )
+        return data
+
+    def _scan_batch(self, batch, data):
+        try:
+            present, bars, lengths, last_close = self._aligned_bars(data, batch)
+            hits = self._scan_bars(present, bars, lengths, last_close) if present else []
+        except Exception:
+            LOGGER.exception("Scan failed for batch starting at %s", batch[0])
+            hits = []
+        return [self._build_signal(*hit) for hit in hits]
+
+    def iter_signals(self, tickers, batch_size=100, prescreen=True):
+        """Yield each batch's signals, news included, as soon as it is scanned."""
+        if prescreen:
+            # Tickers already in today's cache cost no request, so only the
+            # rest are worth a spark call; a warm rerun stays off the network.
+            cached = cached_tickers(tickers, self.HISTORY_PERIOD, self.HISTORY_INTERVAL)
+            uncached = [ticker for ticker in tickers if ticker not in cached]
+            kept = set(self.prescreen(uncached)) if uncached else set()
+            tickers = [ticker for ticker in tickers if ticker in cached or ticker in kept]
+        batches = [(start, tickers[start:start + batch_size])
+                   for start in range(0, len(tickers), batch_size)]
+        # One downloader thread keeps the next batch in flight while this one
+        # is scanned; yf.download is not safe to run concurrently with itself.
+        with ThreadPoolExecutor(max_workers=1) as downloader, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as news_pool:
+            pending = downloader.submit(self._download_batch, *batches[0]) if batches else None
+            for index, (_, batch) in enumerate(batches):
+                data = pending.result()
+                if index + 1 < len(batches):
+                    pending = downloader.submit(self._download_batch, *batches[index + 1])
+                signals = self._scan_batch(batch, data)
+                if not signals:
                     continue
-                signal = self._scan_dataframe(ticker, frame)
-                if signal:
-                    signals.append(signal)
-            time.sleep(pause_seconds)
-        return signals
+                # News & Catalyst: one HTTP round-trip per surviving ticker, overlapped.
+                news = news_pool.map(self._news_text, [signal["ticker"] for signal in signals])
+                for signal, news_text in zip(signals, news):
+                    signal["news"] = news_text
+                yield signals
+
+    def scan_universe(self, tickers, batch_size=100, prescreen=True):
+        return [signal for signals in self.iter_signals(tickers, batch_size, prescreen)
+                for signal in signals]
@@ -3,16 +3,29 @@
 from __future__ import annotations
 
 import base64
+import functools
+import hashlib
 import json
 import logging
 import os
+import pickle
 import time
+from collections import Counter
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, Iterable, List
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speed-up
+    orjson = None
+
 
 def require(*names: str) -> None:
     missing = [n for n in names if not os.getenv(n)]
@@ -22,53 +35,47 @@ def require(*names: str) -> None:
 LOGGER = logging.getLogger(__name__)
 
 
+def _json_loads(data: bytes) -> Any:
+    """Decode JSON bytes, using orjson when it is installed."""
+
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(payload: Any) -> bytes:
+    """Encode ``payload`` as indented JSON bytes, using orjson when installed."""
+
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+    return json.dumps(payload, indent=2).encode("utf-8")
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write ``data`` to ``path`` so readers never see a partial file."""
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
 class RetryError(Exception):
     """Raised when retry attempts are exhausted."""
 
 
+class IncompleteBodyError(RetryError):
+    """Raised when the response body could not be read or decoded in full."""
+
+
 class NonRetryableError(Exception):
     """Raised when retries should not be attempted."""
 
 
-def retry_with_backoff(max_attempts: int = 5, base_delay: float = 1.0) -> Any:
-    """Retry a function with exponential backoff.
-
-    Args:
-        max_attempts: Maximum number of attempts before raising.
-        base_delay: Base delay in seconds for the backoff.
+class NotModifiedError(NonRetryableError):
+    """Raised when a conditional request reports the resource is unchanged."""
 
-    Returns:
-        Wrapped function output.
-    """
 
-    def decorator(func: Any) -> Any:
-        def wrapper(*args: Any, **kwargs: Any) -> Any:
-            attempt = 1
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except NonRetryableError:
-                    raise
-                except Exception as exc:  # noqa: BLE001 - required for resilience
-                    if attempt >= max_attempts:
-                        LOGGER.exception("API call failed after %s attempts", attempt)
-                        raise RetryError(str(exc)) from exc
-                    sleep_time = base_delay * (2 ** (attempt - 1))
-                    LOGGER.warning(
-                        "API call failed on attempt %s: %s. Retrying in %.1fs",
-                        attempt,
-                        exc,
-                        sleep_time,
-                    )
-                    time.sleep(sleep_time)
-                    attempt += 1
-
-        return wrapper
-
-    return decorator
-
-
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Instrument:
     """Represents a filtered Trading 212 instrument."""
 
@@ -78,9 +85,69 @@ class Instrument:
     instrument_type: str
 
 
+_SCHEDULE_EXCHANGE_MAP: Mapping[str, str] = MappingProxyType(
+    {
+        "US_EQUITY": "NYSE/NASDAQ",
+        "LSE_EQUITY": "LSE",
+        "XETRA_EQUITY": "XETRA",
+    }
+)
+
+
+# Raw schedule values as the API sends them, resolved without normalising.
+_FAST_SCHEDULE: Mapping[str, str] = MappingProxyType(
+    {
+        variant: label
+        for schedule_id, label in _SCHEDULE_EXCHANGE_MAP.items()
+        for variant in (schedule_id, schedule_id.lower())
+    }
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _schedule_to_exchange(schedule_id: str) -> str | None:
+    """Resolve a normalized working schedule ID to an exchange label.
+
+    Thousands of instruments share a handful of schedule IDs, so the
+    substring checks below run once per distinct ID.
+    """
+
+    if schedule_id in _SCHEDULE_EXCHANGE_MAP:
+        return _SCHEDULE_EXCHANGE_MAP[schedule_id]
+    for key, label in _SCHEDULE_EXCHANGE_MAP.items():
+        if key in schedule_id:
+            return label
+    if "LSE" in schedule_id:
+        return "LSE"
+    if "XET" in schedule_id:  # also covers XETR and XETRA
+        return "XETRA"
+    if "US" in schedule_id or "NYSE" in schedule_id or "NASDAQ" in schedule_id:
+        return "NYSE/NASDAQ"
+    return None
+
+
+def _ticker_to_exchange(ticker: str) -> str | None:
+    """Fall back to the exchange segment embedded in a Trading 212 ticker."""
+
+    ticker = ticker.upper()
+    if "_LSE" in ticker:
+        return "LSE"
+    if "_XET" in ticker:  # also covers _XETR and _XETRA
+        return "XETRA"
+    if "_US" in ticker or "_NYSE" in ticker or "_NASDAQ" in ticker:
+        return "NYSE/NASDAQ"
+    return None
+
+
 class Trading212Client:
     """Client for Trading 212 universe ingestion."""
 
+    # Retries after the first attempt for transient failures.
+    MAX_RETRIES = 4
+    # Whole-request attempts when the body drops mid-read or fails to decode;
+    # urllib3 only retries up to the response headers.
+    BODY_ATTEMPTS = 3
+
     def __init__(self) -> None:
         self.base_url = "https://live.trading212.com/api/v0"
         self.api_key = os.getenv("T212_API_KEY")
@@ -90,33 +157,130 @@ class Trading212Client:
                 "Missing Trading 212 API credentials. "
                 "Set T212_API_KEY and T212_TRADING_SECRET in your environment."
             )
+        self._headers_cached: Dict[str, str] | None = None
+        self.last_etag: str | None = None
+        self.last_digest: str | None = None
+        # Resolve the schedule strategy once rather than per instrument: the
+        # substring cascade only matters for schedule IDs outside the map.
+        if os.getenv("T212_FULL_INFERENCE") == "1":
+            self._schedule_exchange = _schedule_to_exchange
+        else:
+            self._schedule_exchange = _SCHEDULE_EXCHANGE_MAP.get
+        # Reuse one keep-alive connection for refreshes and retries; urllib3
+        # retries inside the pool and honours Retry-After on 429/503.
+        self._session = requests.Session()
+        retry = Retry(
+            total=self.MAX_RETRIES,
+            backoff_factor=1.0,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.headers.update(self._headers())
+
+    def close(self) -> None:
+        """Release pooled connections."""
+
+        self._session.close()
+
+    def __enter__(self) -> "Trading212Client":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
 
     def _headers(self) -> Dict[str, str]:
-        """Build API headers for Trading 212."""
+        """Return API headers for Trading 212, encoding credentials only once."""
 
-        credentials = f"{self.api_key}:{self.trading_secret}"
-        encoded_credentials = base64.b64encode(credentials.encode("utf-8")).decode(
-            "utf-8"
-        )
-        return {
-            "Authorization": f"Basic {encoded_credentials}",
-            "Accept": "application/json",
-        }
+        if self._headers_cached is None:
+            credentials = f"{self.api_key}:{self.trading_secret}"
+            encoded_credentials = base64.b64encode(credentials.encode("utf-8")).decode(
+                "utf-8"
+            )
+            self._headers_cached = {
+                "Authorization": f"Basic {encoded_credentials}",
+                "Accept": "application/json",
+            }
+        return self._headers_cached
 
-    @retry_with_backoff(max_attempts=5, base_delay=1.0)
-    def fetch_instruments(self) -> List[Dict[str, Any]]:
-        """Fetch all instruments from Trading 212."""
+    def fetch_instruments(
+        self,
+        etag: str | None = None,
+        digest: str | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Fetch all instruments from Trading 212.
+
+        Args:
+            etag: ETag of the payload already cached; sent as ``If-None-Match``.
+            digest: Hash of the raw payload already cached.
+
+        Raises:
+            NotModifiedError: The server confirmed the cached payload is current,
+                or returned a body whose hash matches ``digest``.
+            NonRetryableError: The credentials were rejected.
+            RetryError: The request still failed after the adapter's retries.
+            IncompleteBodyError: The connection dropped while reading the body.
+        """
 
         url = f"{self.base_url}/equity/metadata/instruments"
         LOGGER.info("Fetching instruments from Trading 212")
-        response = requests.get(url, headers=self._headers(), timeout=30)
-        if response.status_code == 401:
-            raise NonRetryableError(
-                "Trading 212 API unauthorized. "
-                "Check T212_API_KEY and T212_TRADING_SECRET."
-            )
-        response.raise_for_status()
-        return response.json()
+        headers = {"If-None-Match": etag} if etag else None
+        try:
+            # Headers only: the body is read below, where its failures can be told apart.
+            response = self._session.get(url, headers=headers, timeout=30, stream=True)
+        except requests.RequestException as exc:
+            LOGGER.exception("Trading 212 instruments request failed after retries")
+            raise RetryError(str(exc)) from exc
+        try:
+            if response.status_code == 401:
+                raise NonRetryableError(
+                    "Trading 212 API unauthorized. "
+                    "Check T212_API_KEY and T212_TRADING_SECRET."
+                )
+            if response.status_code == 304:
+                self.last_etag = response.headers.get("ETag") or etag
+                raise NotModifiedError("Trading 212 instruments unchanged")
+            try:
+                response.raise_for_status()
+            except requests.HTTPError as exc:
+                raise RetryError(str(exc)) from exc
+            content = response.content
+        except requests.RequestException as exc:
+            raise IncompleteBodyError(str(exc)) from exc
+        finally:
+            response.close()
+        self.last_etag = response.headers.get("ETag")
+        self.last_digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        if digest and self.last_digest == digest:
+            raise NotModifiedError("Trading 212 instruments payload unchanged")
+        return _json_loads(content)
+
+    def _fetch_filtered(self, etag: str | None, digest: str | None) -> List[Instrument]:
+        """Fetch and filter the universe, repeating the request if the body is bad."""
+
+        attempt = 1
+        while True:
+            try:
+                return self.filter_instruments(self.fetch_instruments(etag=etag, digest=digest))
+            # orjson's and json's decode errors are both ValueErrors.
+            except (IncompleteBodyError, ValueError) as exc:
+                if attempt == self.BODY_ATTEMPTS:
+                    if isinstance(exc, RetryError):
+                        raise
+                    raise IncompleteBodyError(f"Undecodable instruments payload: {exc}") from exc
+                backoff_seconds = 2 ** attempt
+                LOGGER.warning(
+                    "Trading 212 instruments body incomplete (attempt=%s backoff_seconds=%s): %s",
+                    attempt,
+                    backoff_seconds,
+                    exc,
+                )
+                time.sleep(backoff_seconds)
+                attempt += 1
 
     @staticmethod
     def isa_exchanges() -> Iterable[str]:
@@ -125,14 +289,10 @@ class Trading212Client:
         return {"NYSE", "NASDAQ", "LSE", "XETRA"}
 
     @staticmethod
-    def working_schedule_exchange_map() -> Dict[str, str]:
+    def working_schedule_exchange_map() -> Mapping[str, str]:
         """Map Trading 212 working schedule IDs to exchange labels."""
 
-        return {
-            "US_EQUITY": "NYSE/NASDAQ",
-            "LSE_EQUITY": "LSE",
-            "XETRA_EQUITY": "XETRA",
-        }
+        return _SCHEDULE_EXCHANGE_MAP
 
     def _normalize_schedule_id(self, value: Any) -> str | None:
         if value is None:
@@ -142,74 +302,73 @@ class Trading212Client:
             return self._normalize_schedule_id(nested)
         return str(value).upper()
 
-    def _infer_exchange(self, instrument: Dict[str, Any]) -> str | None:
-        schedule_map = self.working_schedule_exchange_map()
-        schedule_id = self._normalize_schedule_id(
+    @staticmethod
+    def _raw_schedule_id(instrument: Dict[str, Any]) -> Any:
+        return (
             instrument.get("workingScheduleId")
             or instrument.get("workingScheduleID")
             or instrument.get("workingSchedule")
             or instrument.get("scheduleId")
             or instrument.get("scheduleID")
         )
-        if not schedule_id:
-            schedule_id = ""
-        if schedule_id in schedule_map:
-            return schedule_map[schedule_id]
-        for key, label in schedule_map.items():
-            if key in schedule_id:
-                return label
-        if "LSE" in schedule_id:
-            return "LSE"
-        if "XETRA" in schedule_id or "XETR" in schedule_id or "XET" in schedule_id:
-            return "XETRA"
-        if "US" in schedule_id or "NYSE" in schedule_id or "NASDAQ" in schedule_id:
-            return "NYSE/NASDAQ"
-
-        ticker = (instrument.get("ticker") or instrument.get("symbol") or "").upper()
-        if "_LSE" in ticker:
-            return "LSE"
-        if "_XETRA" in ticker or "_XET" in ticker or "_XETR" in ticker:
-            return "XETRA"
-        if "_US" in ticker or "_NYSE" in ticker or "_NASDAQ" in ticker:
-            return "NYSE/NASDAQ"
-        return None
-
-    def filter_instruments(self, instruments: List[Dict[str, Any]]) -> List[Instrument]:
-        """Filter instruments for equities and ISA-compliant exchanges."""
 
-        filtered: List[Instrument] = []
-        unknown_schedules: Dict[str, int] = {}
+    def _schedule_id(self, instrument: Dict[str, Any]) -> str | None:
+        return self._normalize_schedule_id(self._raw_schedule_id(instrument))
+
+    def _infer_exchange(self, schedule_id: str | None, ticker: str | None) -> str | None:
+        exchange = self._schedule_exchange(schedule_id or "")
+        if exchange:
+            return exchange
+        return _ticker_to_exchange(ticker or "")
+
+    def _instrument_exchange(self, instrument: Dict[str, Any], ticker: str) -> str | None:
+        raw = self._raw_schedule_id(instrument)
+        if type(raw) is str:
+            exchange = _FAST_SCHEDULE.get(raw)
+            if exchange:
+                return exchange
+        return self._infer_exchange(self._normalize_schedule_id(raw), ticker)
+
+    def iter_instruments(
+        self,
+        instruments: Iterable[Dict[str, Any]],
+        misses: List[Dict[str, Any]] | None = None,
+    ) -> Iterator[Instrument]:
+        """Yield equities on ISA-compliant exchanges in a single pass.
+
+        Args:
+            instruments: Raw instrument dicts, e.g. streamed from the API.
+            misses: When given, collects equities no exchange rule recognises.
+        """
+
+        # Loop invariants bound once; this runs for every instrument T212 lists.
+        exchange_of = self._instrument_exchange
+        make = Instrument
         for instrument in instruments:
             if instrument.get("type") != "EQUITY":
                 continue
-            exchange = self._infer_exchange(instrument)
-            if not exchange:
-                schedule_id = self._normalize_schedule_id(
-                    instrument.get("workingScheduleId")
-                    or instrument.get("workingScheduleID")
-                    or instrument.get("workingSchedule")
-                    or instrument.get("scheduleId")
-                    or instrument.get("scheduleID")
-                )
-                if schedule_id:
-                    unknown_schedules[schedule_id] = unknown_schedules.get(schedule_id, 0) + 1
-                continue
             ticker = instrument.get("ticker") or instrument.get("symbol")
-            name = instrument.get("name", "Unknown")
-            if not ticker:
-                continue
-            filtered.append(
-                Instrument(
-                    ticker=ticker,
-                    name=name,
-                    exchange=exchange,
-                    instrument_type=instrument.get("type", "EQUITY"),
-                )
-            )
+            exchange = exchange_of(instrument, ticker)
+            if ticker and exchange:
+                yield make(ticker, instrument.get("name", "Unknown"), exchange, "EQUITY")
+            elif not exchange and misses is not None:
+                misses.append(instrument)
+
+    def filter_instruments(self, instruments: Iterable[Dict[str, Any]]) -> List[Instrument]:
+        """Filter instruments for equities and ISA-compliant exchanges."""
+
+        misses: List[Dict[str, Any]] = []
+        filtered = list(self.iter_instruments(instruments, misses))
         LOGGER.info("Filtered %s ISA-eligible equities", len(filtered))
-        if not filtered and unknown_schedules:
-            top_unknown = sorted(unknown_schedules.items(), key=lambda item: item[1], reverse=True)[:5]
-            LOGGER.warning("Unknown workingScheduleId values: %s", top_unknown)
+        # The tally exists only for this warning; skip it when WARNING is filtered out.
+        if not filtered and LOGGER.isEnabledFor(logging.WARNING):
+            unknown_schedules = Counter(
+                schedule_id for item in misses if (schedule_id := self._schedule_id(item))
+            )
+            if unknown_schedules:
+                LOGGER.warning(
+                    "Unknown workingScheduleId values: %s", unknown_schedules.most_common(5)
+                )
         return filtered
 
     def _cache_valid(self, cache_path: Path, max_age_days: int) -> bool:
@@ -218,9 +377,21 @@ class Trading212Client:
         modified_time = datetime.fromtimestamp(cache_path.stat().st_mtime)
         return datetime.now() - modified_time < timedelta(days=max_age_days)
 
+    @staticmethod
+    def _binary_cache_path(cache_path: Path) -> Path:
+        return cache_path.with_suffix(".pkl")
+
     def _load_cached_universe(self, cache_path: Path) -> List[Instrument]:
-        with cache_path.open("r", encoding="utf-8") as handle:
-            payload = json.load(handle)
+        binary_path = self._binary_cache_path(cache_path)
+        if (
+            binary_path.exists()
+            and binary_path.stat().st_mtime >= cache_path.stat().st_mtime
+        ):
+            with binary_path.open("rb") as handle:
+                rows = pickle.load(handle)
+            return [Instrument(*row) for row in rows]
+
+        payload = _json_loads(cache_path.read_bytes())
         return [
             Instrument(
                 ticker=item["ticker"],
@@ -242,8 +413,34 @@ class Trading212Client:
             }
             for inst in instruments
         ]
-        with cache_path.open("w", encoding="utf-8") as handle:
-            json.dump(payload, handle, indent=2)
+        _atomic_write_bytes(cache_path, _json_dumps(payload))
+        # Binary copy for the hot startup path; the JSON stays human-readable.
+        rows = [
+            (inst.ticker, inst.name, inst.exchange, inst.instrument_type)
+            for inst in instruments
+        ]
+        _atomic_write_bytes(
+            self._binary_cache_path(cache_path), pickle.dumps(rows, protocol=5)
+        )
+
+    @staticmethod
+    def _read_marker(path: Path) -> str | None:
+        if not path.exists():
+            return None
+        return path.read_text(encoding="utf-8").strip() or None
+
+    @staticmethod
+    def _write_marker(path: Path, value: str | None) -> None:
+        if value:
+            _atomic_write_bytes(path, value.encode("utf-8"))
+        else:
+            path.unlink(missing_ok=True)
+
+    def _touch_cache(self, cache_path: Path) -> None:
+        cache_path.touch()
+        binary_path = self._binary_cache_path(cache_path)
+        if binary_path.exists():
+            binary_path.touch()
 
     def get_universe(
         self,
@@ -253,71 +450,35 @@ class Trading212Client:
         """Return the cached universe, refreshing from the API when stale."""
 
         cache_file = Path(cache_path)
+        etag_file = cache_file.with_suffix(".etag")
+        digest_file = cache_file.with_suffix(".raw.hash")
         if self._cache_valid(cache_file, max_age_days):
             LOGGER.info("Loading cached universe from %s", cache_file)
             cached = self._load_cached_universe(cache_file)
             if cached:
                 return cached
             LOGGER.warning("Cached universe was empty; refreshing from Trading 212.")
+            etag_file.unlink(missing_ok=True)
+            digest_file.unlink(missing_ok=True)
 
         LOGGER.info("Refreshing universe cache from Trading 212")
-        raw_instruments = self.fetch_instruments()
-        filtered = self.filter_instruments(raw_instruments)
+        etag = self._read_marker(etag_file) if cache_file.exists() else None
+        digest = self._read_marker(digest_file) if cache_file.exists() else None
+        try:
+            filtered = self._fetch_filtered(etag, digest)
+        except NotModifiedError:
+            LOGGER.info("Trading 212 universe unchanged; reusing %s", cache_file)
+            self._touch_cache(cache_file)
+            # A digest match can arrive with a new ETag; keep If-None-Match current.
+            if self.last_etag:
+                self._write_marker(etag_file, self.last_etag)
+            return self._load_cached_universe(cache_file)
         if filtered:
             self._save_cached_universe(cache_file, filtered)
+            self._write_marker(etag_file, self.last_etag)
+            self._write_marker(digest_file, self.last_digest)
         else:
             LOGGER.warning(
                 "Universe filter returned 0 instruments; cache not updated."
             )
         return filtered
-
-    def _cache_valid(self, cache_path: Path, max_age_days: int) -> bool:
-        if not cache_path.exists():
-            return False
-        modified_time = datetime.fromtimestamp(cache_path.stat().st_mtime)
-        return datetime.now() - modified_time < timedelta(days=max_age_days)
-
-    def _load_cached_universe(self, cache_path: Path) -> List[Instrument]:
-        with cache_path.open("r", encoding="utf-8") as handle:
-            payload = json.load(handle)
-        return [
-            Instrument(
-                ticker=item["ticker"],
-                name=item["name"],
-                exchange=item["exchange"],
-                instrument_type=item.get("instrument_type", "EQUITY"),
-            )
-            for item in payload
-        ]
-
-    def _save_cached_universe(self, cache_path: Path, instruments: List[Instrument]) -> None:
-        cache_path.parent.mkdir(parents=True, exist_ok=True)
-        payload = [
-            {
-                "ticker": inst.ticker,
-                "name": inst.name,
-                "exchange": inst.exchange,
-                "instrument_type": inst.instrument_type,
-            }
-            for inst in instruments
-        ]
-        with cache_path.open("w", encoding="utf-8") as handle:
-            json.dump(payload, handle, indent=2)
-
-    def get_universe(
-        self,
-        cache_path: str = "data/universe.json",
-        max_age_days: int = 7,
-    ) -> List[Instrument]:
-        """Return the cached universe, refreshing from the API when stale."""
-
-        cache_file = Path(cache_path)
-        if self._cache_valid(cache_file, max_age_days):
-            LOGGER.info("Loading cached universe from %s", cache_file)
-            return self._load_cached_universe(cache_file)
-
-        LOGGER.info("Refreshing universe cache from Trading 212")
-        raw_instruments = self.fetch_instruments()
-        filtered = self.filter_instruments(raw_instruments)
-        self._save_cached_universe(cache_file, filtered)
-        return filtered
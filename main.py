@@ -1,42 +1,71 @@
+import atexit
 import logging
-import os
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 from dotenv import load_dotenv
 
 ROOT = Path(__file__).resolve().parent
 ENV_FILE = ROOT / ".env"
-load_dotenv(ENV_FILE)
 
 from engine.t212_client import Trading212Client
 from engine.scanner import AlphaScanner
 from engine.persistence import DatabaseManager
 from engine.notifier import Notifier
 
-# --- ADD THIS BLOCK TO THE TOP OF main.py ---
-# Ensure necessary directories exist
-for folder in ['logs', 'data']:
-    if not os.path.exists(folder):
-        os.makedirs(folder)
-# --------------------------------------------
-
-# Now your logging config will work without crashing
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
-logging.basicConfig(
-    level=logging.INFO,
-    format=LOG_FORMAT,
-    handlers=[
-        logging.FileHandler("logs/pipeline.log"),
-        logging.StreamHandler(sys.stdout),
-    ],
-)
+_log_listener = None
+
+def _bootstrap():
+    """Load .env, create the working folders and start logging, once per process.
+
+    Runs from ``main()`` rather than at import, so importing this module (or
+    calling ``main()`` twice) never attaches a second set of log handlers.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    load_dotenv(ENV_FILE)
+
+    # Ensure necessary directories exist; one mkdir each, EEXIST is not an error.
+    for folder in ('logs', 'data'):
+        Path(folder).mkdir(parents=True, exist_ok=True)
+
+    # Log calls only enqueue; a listener thread does the file and console writes.
+    log_queue = queue.SimpleQueue()
+    handlers = [logging.FileHandler("logs/pipeline.log"), logging.StreamHandler(sys.stdout)]
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _log_listener = QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    logging.root.setLevel(logging.INFO)
+    logging.root.addHandler(QueueHandler(log_queue))
+
+def scan_candidates(isa_universe, scanner, db):
+    """Pass 1: all CPU-side filtering, so the network pass sees the final list.
+
+    Cooldown/blacklisted names are dropped before any Yahoo download is issued;
+    the result is sorted, so batches are the same from run to run.
+    """
+    tickers = scanner.clean_tickers(inst.ticker for inst in isa_universe)
+    candidates = db.filter_eligible(tickers)
+    logging.info(
+        "Skipping %s blacklisted or recently alerted stocks", len(tickers) - len(candidates)
+    )
+    return candidates
 
 def main():
+    _bootstrap()
+    t212 = None
+    db = None
+    bot = None
     try:
         t212 = Trading212Client()
-        scanner = AlphaScanner()
         db = DatabaseManager()
+        scanner = AlphaScanner(metadata=db)
         bot = Notifier()
 
         # 1. Cache Check + Ingest
@@ -44,26 +73,39 @@ def main():
 
         logging.info("Preparing scan universe for %s stocks...", len(isa_universe))
 
-        tickers = []
-        for inst in isa_universe:
-            yf_ticker = scanner.clean_ticker(inst.ticker)
-            if db.is_blacklisted(yf_ticker) or db.was_alerted_recently(yf_ticker):
-                continue
-            tickers.append(yf_ticker)
-
-        unique_tickers = sorted(set(tickers))
+        unique_tickers = scan_candidates(isa_universe, scanner, db)
         logging.info("Starting batch scan for %s stocks...", len(unique_tickers))
 
-        # 2. Batch Scan
-        signals = scanner.scan_universe(unique_tickers)
-        for signal in signals:
-            bot.send_alert(signal)
-            db.record_signal(signal["ticker"], signal["entry"])
+        # 2. Batch Scan; alerts go out in the background while later batches scan.
+        bot.start()
+        for signals in scanner.iter_signals(unique_tickers):
+            for signal in signals:
+                logging.info(
+                    "Signal %s: entry %s, stop %s, target %s, RSI %s",
+                    signal["ticker"], signal["entry"], signal["stop"], signal["target"], signal["rsi"],
+                )
+            bot.submit(signals)
+        # Only delivered alerts start the cooldown; failed ones retry next run.
+        # With Telegram disabled every signal is recorded, as before.
+        delivered = bot.finish()
+        db.record_signals([(signal["ticker"], signal["entry"]) for signal in delivered])
 
     except Exception:
         logging.exception("FATAL ERROR")
         # Send one-off Telegram error if needed
         raise
+    finally:
+        if t212 is not None:
+            t212.close()
+        try:
+            if bot is not None:
+                # A failed scan may already have sent alerts; they still get their cooldown.
+                delivered = bot.close()
+                if delivered and db is not None:
+                    db.record_signals([(signal["ticker"], signal["entry"]) for signal in delivered])
+        finally:
+            if db is not None:
+                db.close()
 
 if __name__ == "__main__":
     main()